@@ -1,14 +1,21 @@
 #!/usr/bin/env python
 
 import argparse
-import json
 import shutil
 import subprocess
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import orjson
+
+from probe_cache import probe
+from video_index import append_video_records, read_video_index, seed_video_index
+
 
 VIDEOS_DIR = Path("videos")
+VIDEOS_INDEX = Path("videos/videos.jsonl")
+# pretty snapshot of the index, written only with -export-json
 VIDEOS_JSON = Path("videos/videos.json")
 
 PREVIEW_HEIGHT = 640
@@ -19,36 +26,27 @@ PREVIEW_DURATION = 3
 def ensure_environment():
     VIDEOS_DIR.mkdir(exist_ok=True)
 
-    if not VIDEOS_JSON.exists():
-        VIDEOS_JSON.write_text(json.dumps({"videos": []}, indent=2))
-        return
+    if not VIDEOS_INDEX.exists():
+        seed_video_index(VIDEOS_INDEX, VIDEOS_JSON)
 
-    if VIDEOS_JSON.stat().st_size == 0:
-        VIDEOS_JSON.write_text(json.dumps({"videos": []}, indent=2))
-        return
 
-    try:
-        json.loads(VIDEOS_JSON.read_text())
-    except json.JSONDecodeError:
-        VIDEOS_JSON.write_text(json.dumps({"videos": []}, indent=2))
+def export_videos_json():
+    videos = list(read_video_index(VIDEOS_INDEX).values())
+    VIDEOS_JSON.write_bytes(orjson.dumps({"videos": videos}, option=orjson.OPT_INDENT_2))
 
 
-def get_video_duration(path: Path) -> str:
-    cmd = [
-        "ffprobe",
-        "-v", "error",
-        "-show_entries", "format=duration",
-        "-of", "default=noprint_wrappers=1:nokey=1",
-        str(path)
-    ]
-
-    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-    seconds = float(result.stdout.strip())
+def get_video_metadata(path: Path) -> dict:
+    info = probe(path)
+    seconds = float(info["format"]["duration"])
 
     mins = int(seconds // 60)
     secs = int(seconds % 60)
 
-    return f"{mins:02d}:{secs:02d}"
+    return {
+        "duration": f"{mins:02d}:{secs:02d}",
+        "duration_seconds": seconds,
+        "has_audio": any(s.get("codec_type") == "audio" for s in info.get("streams", [])),
+    }
 
 
 def generate_preview(input_path: Path, preview_path: Path):
@@ -69,18 +67,27 @@ def generate_preview(input_path: Path, preview_path: Path):
 
 def main():
     parser = argparse.ArgumentParser(description="Add video to gallery")
-    parser.add_argument("video", help="Path to video file")
+    parser.add_argument("video", nargs="?", help="Path to video file")
     parser.add_argument("-tags", help="Comma-separated tags", default="")
     parser.add_argument("-url", help="Base URL for preview storage", default="")
+    parser.add_argument("-export-json", action="store_true", help="Write videos.json from the index")
 
     args = parser.parse_args()
 
+    if args.video is None and not args.export_json:
+        parser.error("a video path or -export-json is required")
+
+    ensure_environment()
+
+    if args.video is None:
+        export_videos_json()
+        print(f"Exported {VIDEOS_JSON}")
+        return
+
     input_video = Path(args.video)
     if not input_video.exists():
         raise FileNotFoundError(f"Video not found: {input_video}")
 
-    ensure_environment()
-
     video_name = input_video.stem
     video_ext = input_video.suffix
 
@@ -92,9 +99,12 @@ def main():
 
     shutil.copy2(input_video, stored_video_path)
 
-    generate_preview(stored_video_path, preview_path)
-
-    duration = get_video_duration(stored_video_path)
+    # the preview encode and the probe both only read the stored video
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        preview_future = ex.submit(generate_preview, stored_video_path, preview_path)
+        metadata_future = ex.submit(get_video_metadata, stored_video_path)
+        preview_future.result()
+        metadata = metadata_future.result()
 
     tags = [t.strip() for t in args.tags.split(",") if t.strip()]
 
@@ -108,22 +118,27 @@ def main():
         "id": str(uuid.uuid4()),
         "name": stored_video_name,
         "url": preview_url,
-        "duration": duration,
+        "duration": metadata["duration"],
+        "duration_seconds": metadata["duration_seconds"],
+        "has_audio": metadata["has_audio"],
         "tags": tags
     }
 
     # if any entry exists with the same name, overwrite it
-    data = json.loads(VIDEOS_JSON.read_text())
-    videos = data.setdefault("videos", [])
-    videos[:] = [v for v in videos if v.get("name") != stored_video_name]
-    videos.append(entry)
+    tombstones = [
+        {"id": v["id"], "deleted": True, "name": v["name"]}
+        for v in read_video_index(VIDEOS_INDEX).values()
+        if v.get("name") == stored_video_name
+    ]
+    append_video_records(VIDEOS_INDEX, tombstones + [entry])
 
-    VIDEOS_JSON.write_text(json.dumps(data, indent=2))
+    if args.export_json:
+        export_videos_json()
 
     print("Video added")
     print(f"   ID: {entry['id']}")
     print(f"   Preview: {preview_path}")
-    print(f"   Duration: {duration}")
+    print(f"   Duration: {metadata['duration']}")
 
 
 if __name__ == "__main__":
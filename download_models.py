@@ -1,5 +1,14 @@
+import importlib.util
+import os
 from pathlib import Path
+
+# must be set before huggingface_hub is imported; only enable the rust
+# downloader if it is installed, otherwise huggingface_hub refuses to run
+if importlib.util.find_spec("hf_transfer") is not None:
+    os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
+
 from huggingface_hub import snapshot_download
+from huggingface_hub.utils import disable_progress_bars
 
 # REPO_ID = "onnx-community/Kokoro-82M-v1.0-ONNX"
 
@@ -20,6 +29,9 @@ from huggingface_hub import snapshot_download
 
 REPO_ID = "Supertone/supertonic"
 
+if os.getenv("CI"):
+    disable_progress_bars()
+
 TARGET_DIR = Path(__file__).parent / "models" / "supertonic"
 TARGET_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -27,6 +39,8 @@ snapshot_download(
     repo_id=REPO_ID,
     local_dir=TARGET_DIR,
     local_dir_use_symlinks=False,
+    max_workers=8,
+    etag_timeout=30,
     # allow_patterns=[
     #     "voices/**",
     #     "onnx/model.onnx",
@@ -35,4 +49,28 @@ snapshot_download(
     # ],
 )
 
+# int8 copies of the onnx graphs for CPU inference (used with TTS_INT8=1); only
+# MatMul weights are quantized, which covers the transformer GEMMs without
+# touching the vocoder convs. the quantizer needs the optional onnx package.
+try:
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+except ImportError:
+    quantize_dynamic = None
+    print("onnx is not installed, skipping int8 quantization (pip install onnx to enable)")
+
+ONNX_DIR = TARGET_DIR / "onnx"
+if quantize_dynamic is not None:
+    for name in ("duration_predictor", "text_encoder", "vector_estimator", "vocoder"):
+        src = ONNX_DIR / f"{name}.onnx"
+        dst = ONNX_DIR / f"{name}_int8.onnx"
+        if dst.exists() or not src.exists():
+            continue
+        quantize_dynamic(
+            src,
+            dst,
+            weight_type=QuantType.QInt8,
+            op_types_to_quantize=["MatMul"],
+        )
+        print(f"quantized {src.name} -> {dst.name}")
+
 print("download complete")
@@ -1,46 +1,235 @@
+import asyncio
+import os
+import re
 import subprocess
-import json
+from collections import deque
 from pathlib import Path
 
+from probe_cache import probe_async
 
-def get_duration(file_path):
-    """Get duration of media file in seconds using ffprobe."""
-    cmd = [
-        "ffprobe",
-        "-v", "error",
-        "-show_entries", "format=duration",
-        "-of", "json",
-        str(file_path)
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-    data = json.loads(result.stdout)
-    return float(data["format"]["duration"])
 
+# lines of ffmpeg's log kept for error messages
+STDERR_TAIL_LINES = 20
 
-def dub_video(
+# longer log lines (e.g. huge metadata tags) are cut to this many bytes
+MAX_STDERR_LINE = 4096
+
+# key=value lines written by -progress
+PROGRESS_LINE = re.compile(r"^(\w+)=(\S*)$")
+
+
+def _handle_stderr_line(raw, tail, on_progress):
+    line = raw.decode(errors="replace").strip()
+    match = PROGRESS_LINE.match(line)
+    if match:
+        key, value = match.groups()
+        if key == "out_time_us" and on_progress is not None and value.isdigit():
+            on_progress(int(value) / 1_000_000)
+    elif line:
+        tail.append(line)
+
+
+async def _drain_ffmpeg_stderr(stream, on_progress=None, chunk_size=65536):
+    """Consume ffmpeg's stderr, returning only the last few log lines.
+
+    Progress records from -progress are passed to on_progress as seconds of
+    output encoded so far instead of being kept. stderr is read in fixed-size
+    chunks rather than with readline, because ffmpeg writes each metadata tag
+    on one line and a long tag would overrun StreamReader's line limit; lines
+    longer than MAX_STDERR_LINE are truncated.
+    """
+    tail = deque(maxlen=STDERR_TAIL_LINES)
+    partial = b""
+    while chunk := await stream.read(chunk_size):
+        *lines, rest = (partial + chunk).split(b"\n")
+        for raw in lines:
+            _handle_stderr_line(raw[:MAX_STDERR_LINE], tail, on_progress)
+        # an unterminated line only keeps its head until its newline arrives
+        partial = rest[:MAX_STDERR_LINE]
+    if partial:
+        _handle_stderr_line(partial, tail, on_progress)
+    return "\n".join(tail)
+
+
+async def _feed_stdin(proc, data):
+    try:
+        proc.stdin.write(data)
+        await proc.stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # ffmpeg exited early; its return code carries the error
+        pass
+    finally:
+        proc.stdin.close()
+
+
+async def run_ffmpeg(cmd, input=None, on_progress=None):
+    """Run an ffmpeg command without blocking the event loop or buffering its log."""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE if input is not None else None,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        tasks = [_drain_ffmpeg_stderr(proc.stderr, on_progress)]
+        if input is not None:
+            tasks.append(_feed_stdin(proc, input))
+        err, *_ = await asyncio.gather(*tasks)
+        await proc.wait()
+    finally:
+        # cancelled, or a progress callback raised: don't leave an orphan encode
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+    if proc.returncode != 0:
+        raise RuntimeError(f"{cmd[0]} exited with code {proc.returncode}: {err}")
+
+
+VAAPI_DEVICE = os.getenv("VAAPI_DEVICE", "/dev/dri/renderD128")
+
+# preference order when more than one hardware encoder works
+HW_ENCODERS = ("h264_nvenc", "h264_vaapi", "h264_videotoolbox")
+
+# a wedged GPU driver must not hang server startup
+ENCODER_PROBE_TIMEOUT = 10
+
+
+def _encoder_works(encoder):
+    """Encode a few blank frames to check the encoder has a usable device."""
+    cmd = ["ffmpeg", "-hide_banner", "-v", "error"]
+    vf = "format=yuv420p"
+    if encoder == "h264_vaapi":
+        cmd.extend(["-vaapi_device", VAAPI_DEVICE])
+        vf = "format=nv12,hwupload"
+    cmd.extend([
+        "-f", "lavfi", "-i", "color=size=256x256:duration=0.2",
+        "-vf", vf,
+        "-c:v", encoder,
+        "-f", "null", "-"
+    ])
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=ENCODER_PROBE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return False
+    return result.returncode == 0
+
+
+def detect_hw_encoder():
+    """Return the first working hardware H.264 encoder, or None for libx264."""
+    # HW_ENCODER=none forces software encoding, one of HW_ENCODERS forces that encoder
+    forced = os.getenv("HW_ENCODER")
+    if forced:
+        if forced == "none":
+            return None
+        if forced not in HW_ENCODERS:
+            raise ValueError(
+                f"HW_ENCODER must be 'none' or one of {', '.join(HW_ENCODERS)}, not {forced!r}"
+            )
+        return forced
+
+    try:
+        result = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"],
+            capture_output=True, text=True, check=True,
+            timeout=ENCODER_PROBE_TIMEOUT,
+        )
+    except (OSError, subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        return None
+
+    for encoder in HW_ENCODERS:
+        if encoder in result.stdout and _encoder_works(encoder):
+            return encoder
+    return None
+
+
+HWENC = detect_hw_encoder()
+print(f"Video encoder: {HWENC or 'libx264'}")
+
+
+def _video_codec_args(hwenc):
+    """Return (input args, video filter suffix, output args) for an encoder."""
+    if hwenc == "h264_nvenc":
+        return (
+            ["-hwaccel", "auto"],
+            "",
+            [
+                "-c:v", "h264_nvenc",
+                "-preset", "p4",
+                "-tune", "hq",
+                "-b:v", "4M",
+                "-maxrate", "6M",
+                "-bufsize", "8M",
+                "-bf", "2",
+                "-refs", "1",
+                "-pix_fmt", "yuv420p",
+            ],
+        )
+    if hwenc == "h264_vaapi":
+        # the subtitles filter runs on system memory, so upload afterwards
+        return (
+            ["-vaapi_device", VAAPI_DEVICE, "-hwaccel", "auto"],
+            ",format=nv12,hwupload",
+            ["-c:v", "h264_vaapi", "-b:v", "4M"],
+        )
+    if hwenc == "h264_videotoolbox":
+        return (
+            ["-hwaccel", "auto"],
+            "",
+            ["-c:v", "h264_videotoolbox", "-b:v", "4M", "-pix_fmt", "yuv420p"],
+        )
+    return (
+        [],
+        "",
+        ["-c:v", "libx264", "-preset", "fast", "-pix_fmt", "yuv420p"],
+    )
+
+
+async def _build_dub_command(
     video_path,
     voice_path,
     srt_path,
-    output_path,
+    output_args,
     video_audio_volume=0.0,
     font_name="Inter",
     font_size=16,
     outline=2,
     shadow=1,
     margin_v=80,
+    video_duration=None,
+    video_has_audio=None,
+    voice_pcm=None,
+    voice_sr=None,
 ):
     video_path = Path(video_path)
-    voice_path = Path(voice_path)
     srt_path = Path(srt_path)
-    output_path = Path(output_path)
 
-    for p in (video_path, voice_path, srt_path):
+    required = [video_path, srt_path]
+    if voice_pcm is None:
+        voice_path = Path(voice_path)
+        required.append(voice_path)
+
+    for p in required:
         if not p.exists():
             raise FileNotFoundError(p)
 
-    # Get durations
-    video_duration = get_duration(video_path)
-    audio_duration = get_duration(voice_path)
+    # gallery entries carry the video's metadata, so only probe what the
+    # caller didn't already know; one probe per file covers everything
+    if video_duration is None or video_has_audio is None:
+        vprobe = await probe_async(video_path)
+        if video_duration is None:
+            video_duration = float(vprobe["format"]["duration"])
+        if video_has_audio is None:
+            # it is possible the video does not have an audio
+            video_has_audio = any(s.get("codec_type") == "audio" for s in vprobe.get("streams", []))
+
+    if voice_pcm is not None:
+        # raw mono float32 samples, fed to ffmpeg over stdin
+        audio_duration = len(voice_pcm) / 4 / voice_sr
+        voice_input = ["-f", "f32le", "-ar", str(voice_sr), "-ac", "1", "-i", "pipe:0"]
+    else:
+        aprobe = await probe_async(voice_path)
+        audio_duration = float(aprobe["format"]["duration"])
+        voice_input = ["-i", str(voice_path)]
 
     # Calculate loop count
     loop_count = int(audio_duration / video_duration) if audio_duration > video_duration else 0
@@ -58,43 +247,111 @@ def dub_video(
         f"MarginV={margin_v}"
     )
 
-    # Check if video has audio
-    # it is possible the video does not have an audio
-    cmd_probe = ["ffprobe", "-v", "error", "-select_streams", "a", "-show_entries", "stream=index", "-of", "json", str(video_path)]
-    result = subprocess.run(cmd_probe, capture_output=True, text=True)
-    video_has_audio = bool(json.loads(result.stdout).get("streams"))
+    # only demux the video's own audio when it is actually mixed in
+    use_video_audio = video_has_audio and video_audio_volume > 0
+
+    hw_input_args, video_filter_suffix, video_codec_args = _video_codec_args(HWENC)
 
-    # Build audio filter
-    if video_has_audio and video_audio_volume > 0:
+    # Build a single filter graph for subtitles and audio
+    video_filter = (
+        f"[0:v]subtitles='{srt_path.as_posix()}':force_style={subtitle_style}"
+        f"{video_filter_suffix}[outv]"
+    )
+    if use_video_audio:
         audio_filter = (
             f"[0:a]atrim=0:{audio_duration},volume={video_audio_volume}[va];"
             f"[1:a]volume=1.0[ta];"
             f"[va][ta]amix=inputs=2:dropout_transition=0,atrim=0:{audio_duration}[outa]"
         )
-        map_audio = ["-map", "[outa]"]
     else:
         audio_filter = f"[1:a]atrim=0:{audio_duration},volume=1.0[outa]"
-        map_audio = ["-map", "[outa]"]
 
-    cmd = ["ffmpeg", "-y"]
-    
+    # -progress reports on stderr as plain lines, which can be parsed as they arrive
+    cmd = ["ffmpeg", "-y", "-nostats", "-progress", "pipe:2"] + hw_input_args
+
+    # -stream_loop is kept: -loop only applies to image inputs
     if loop_count > 0:
         cmd.extend(["-stream_loop", str(loop_count)])
-    
+
+    if not use_video_audio:
+        cmd.append("-an")
+
     cmd.extend([
         "-i", str(video_path),
-        "-i", str(voice_path),
-        "-vf", f"subtitles='{srt_path.as_posix()}':force_style={subtitle_style}",
-        "-filter_complex", audio_filter,
-        "-map", "0:v:0",
-    ] + map_audio + [
-        "-c:v", "libx264",
-        "-preset", "fast",
-        "-pix_fmt", "yuv420p",
+    ] + voice_input + [
+        "-filter_complex", f"{video_filter};{audio_filter}",
+        "-map", "[outv]",
+        "-map", "[outa]",
+    ] + video_codec_args + [
         "-c:a", "aac",
         "-b:a", "192k",
         "-shortest",
-        str(output_path)
-    ])
+    ] + output_args)
+
+    return cmd
+
 
-    subprocess.run(cmd, check=True)
+async def dub_video(
+    video_path,
+    voice_path,
+    srt_path,
+    output_path,
+    voice_pcm=None,
+    voice_sr=None,
+    on_progress=None,
+    **options,
+):
+    """Dub video_path with the voice track and subtitles, writing an mp4 to output_path.
+
+    The voice is read from voice_path, or from voice_pcm (mono float32 bytes at
+    voice_sr Hz) when given, which is piped in without a temporary wav file.
+    on_progress, if given, is called with the seconds of output encoded so far.
+    """
+    cmd = await _build_dub_command(
+        video_path, voice_path, srt_path, [str(Path(output_path))],
+        voice_pcm=voice_pcm, voice_sr=voice_sr, **options
+    )
+    await run_ffmpeg(cmd, input=voice_pcm, on_progress=on_progress)
+
+
+async def stream_dub_video(
+    video_path,
+    voice_path,
+    srt_path,
+    voice_pcm=None,
+    voice_sr=None,
+    chunk_size=65536,
+    **options,
+):
+    """Dub like dub_video, yielding fragmented mp4 bytes as ffmpeg produces them."""
+    cmd = await _build_dub_command(
+        video_path, voice_path, srt_path,
+        ["-f", "mp4", "-movflags", "+frag_keyframe+empty_moov+default_base_moof", "pipe:1"],
+        voice_pcm=voice_pcm, voice_sr=voice_sr, **options,
+    )
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE if voice_pcm is not None else None,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdin_task = None
+    if voice_pcm is not None:
+        stdin_task = asyncio.create_task(_feed_stdin(proc, voice_pcm))
+    # ffmpeg blocks once the stderr pipe fills, so drain it alongside stdout
+    stderr_task = asyncio.create_task(_drain_ffmpeg_stderr(proc.stderr))
+    try:
+        while chunk := await proc.stdout.read(chunk_size):
+            yield chunk
+        await proc.wait()
+        err = await stderr_task
+        if proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with code {proc.returncode}: {err}")
+    finally:
+        # the client may disconnect mid-stream
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        stderr_task.cancel()
+        if stdin_task is not None:
+            stdin_task.cancel()
@@ -0,0 +1,34 @@
+import asyncio
+import functools
+import subprocess
+from pathlib import Path
+
+import orjson
+
+
+@functools.lru_cache(maxsize=256)
+def _probe_cached(path: str, size: int, mtime: float) -> dict:
+    # size and mtime are only part of the key, so an edited file is re-probed
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-show_streams",
+        "-show_format",
+        "-of", "json",
+        path
+    ]
+    # the JSON document is bounded; ffprobe's log isn't needed
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    return orjson.loads(result.stdout)
+
+
+def probe(path) -> dict:
+    """Return ffprobe's format + streams info for a file, cached per (path, size, mtime)."""
+    p = Path(path).resolve()
+    st = p.stat()
+    return _probe_cached(str(p), st.st_size, st.st_mtime)
+
+
+async def probe_async(path) -> dict:
+    """Same as probe, but runs any ffprobe spawn off the event loop."""
+    return await asyncio.to_thread(probe, path)
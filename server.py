@@ -1,14 +1,20 @@
 import os
-import json
+import stat
+import asyncio
+import time
 import uuid
 from pathlib import Path
 from typing import Optional, Protocol
 from abc import ABC, abstractmethod
+from collections import defaultdict
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-import soundfile as sf
+import numpy as np
+import orjson
 from fastapi import FastAPI, HTTPException, UploadFile, File
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 
@@ -18,15 +24,23 @@ from supertonic_helper import (
     Style,
     TextToSpeech,
 )
-from ffmpeg_dub import dub_video
+from ffmpeg_dub import dub_video, stream_dub_video
+from video_index import read_video_index, seed_video_index
 
 
 class TTSResult(BaseModel):
-    wav_path: str
+    # mono float32 PCM, piped straight into ffmpeg
+    pcm: bytes
+    sample_rate: int
     srt_path: str
     duration: float
 
 
+@lru_cache(maxsize=None)
+def _load_style(path: str) -> Style:
+    return load_voice_style([path])
+
+
 class TTSModel(ABC):
     @abstractmethod
     def get_available_voices(self) -> list[str]:
@@ -64,17 +78,30 @@ class SupertonicModel(TTSModel):
     }
 
     def __init__(self, onnx_dir: str, output_dir: str):
-        self.tts = load_text_to_speech(onnx_dir, use_gpu=False)
+        # TTS_DEVICE=auto only picks up CUDA; CoreML/DirectML sessions are
+        # less tested, so they are used only with TTS_DEVICE=gpu
+        device = os.getenv("TTS_DEVICE", "auto")
+        if device not in ("auto", "gpu", "cpu"):
+            raise ValueError(f"TTS_DEVICE must be auto, gpu or cpu, not {device!r}")
+        self.tts = load_text_to_speech(
+            onnx_dir,
+            use_gpu=device != "cpu",
+            gpu_providers=["CUDAExecutionProvider"] if device == "auto" else None,
+            # opt-in: set TTS_INT8=1 to use the int8 graphs from download_models.py
+            # once their output quality has been checked for your voices
+            use_int8=os.getenv("TTS_INT8", "0") == "1",
+        )
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
-        self.voice_styles = self._load_all_voices()
+        self.voice_styles = self._load_all_voices(onnx_dir)
 
-    def _load_all_voices(self) -> dict[str, Style]:
-        styles = {}
-        for name, file_prefix in self.VOICE_MAP.items():
-            path = f"models/supertonic/voice_styles/{file_prefix}.json"
-            styles[name] = load_voice_style([path])
-        return styles
+    def _load_all_voices(self, onnx_dir: str) -> dict[str, Style]:
+        # voice styles live next to the onnx dir, e.g. models/supertonic/voice_styles
+        styles_dir = Path(onnx_dir).parent / "voice_styles"
+        names = list(self.VOICE_MAP.keys())
+        paths = [str(styles_dir / f"{self.VOICE_MAP[name]}.json") for name in names]
+        with ThreadPoolExecutor(max_workers=len(paths)) as ex:
+            return dict(zip(names, ex.map(_load_style, paths)))
 
     def get_available_voices(self) -> list[str]:
         return list(self.VOICE_MAP.keys())
@@ -102,35 +129,40 @@ class SupertonicModel(TTSModel):
         )
 
         job_id = str(uuid.uuid4())
-        wav_path = self.output_dir / f"{job_id}.wav"
         srt_path = self.output_dir / f"{job_id}.srt"
 
-        sf.write(str(wav_path), wav[0], self.tts.sample_rate)
+        # the subtitles filter needs a real file, the audio doesn't
         self._write_srt(srt_path, timestamps)
 
         return TTSResult(
-            wav_path=str(wav_path),
+            pcm=wav[0].astype(np.float32).tobytes(),
+            sample_rate=self.tts.sample_rate,
             srt_path=str(srt_path),
             duration=float(duration),
         )
 
     @staticmethod
-    def _write_srt(path: Path, timestamps: list[dict]):
-        def format_time(seconds: float) -> str:
-            h = int(seconds // 3600)
-            m = int((seconds % 3600) // 60)
-            s = seconds % 60
-            return f"{h:02}:{m:02}:{s:06.3f}".replace(".", ",")
+    def _format_srt_times(seconds: np.ndarray) -> list[str]:
+        # work in whole milliseconds so rounding can never produce "60,000"
+        ms = np.rint(seconds * 1000).astype(np.int64)
+        h, ms = np.divmod(ms, 3_600_000)
+        m, ms = np.divmod(ms, 60_000)
+        s, ms = np.divmod(ms, 1000)
+        return [
+            f"{hh:02}:{mm:02}:{ss:02},{mss:03}"
+            for hh, mm, ss, mss in zip(h.tolist(), m.tolist(), s.tolist(), ms.tolist())
+        ]
 
-        lines = []
-        for i, t in enumerate(timestamps, start=1):
-            lines.append(str(i))
-            lines.append(f"{format_time(t['start'])} --> {format_time(t['end'])}")
-            lines.append(t["text"])
-            lines.append("")
+    @classmethod
+    def _write_srt(cls, path: Path, timestamps: list[dict]):
+        starts = cls._format_srt_times(np.asarray([t["start"] for t in timestamps], dtype=np.float64))
+        ends = cls._format_srt_times(np.asarray([t["end"] for t in timestamps], dtype=np.float64))
 
-        with open(path, "w", encoding="utf-8") as f:
-            f.write("\n".join(lines))
+        parts = [
+            f"{i}\n{start} --> {end}\n{t['text']}\n".encode("utf-8")
+            for i, (start, end, t) in enumerate(zip(starts, ends, timestamps), start=1)
+        ]
+        path.write_bytes(b"\n".join(parts))
 
 
 class ModelRegistry:
@@ -147,8 +179,8 @@ class ModelRegistry:
 
     def list_models(self) -> list[dict]:
         models_data = []
-        with open("models.json", "r") as f:
-            config = json.load(f)
+        with open("models.json", "rb") as f:
+            config = orjson.loads(f.read())
 
         for model_config in config["models"]:
             name = model_config["name"]
@@ -161,11 +193,165 @@ class ModelRegistry:
         return models_data
 
 
+class JobStore:
+    """In-memory job table, mirrored to a JSON file so restarts keep history."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.jobs: dict[str, dict] = {}
+        self.lock = asyncio.Lock()
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            self.jobs = orjson.loads(self.path.read_bytes())
+        except orjson.JSONDecodeError:
+            self.jobs = {}
+
+        # anything still in flight when the server stopped will never finish
+        for job in self.jobs.values():
+            if job["status"] in ("pending", "running"):
+                job["status"] = "error"
+                job["error"] = "Interrupted by server restart"
+        self._write(self._snapshot())
+
+    def _snapshot(self) -> bytes:
+        # progress is only meaningful while the encode runs, so it is not persisted
+        return orjson.dumps({
+            job_id: {k: v for k, v in job.items() if k != "progress"}
+            for job_id, job in self.jobs.items()
+        })
+
+    def _write(self, data: bytes):
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(self.path)
+
+    async def _save(self):
+        # snapshot under the caller's lock, write off the event loop
+        await asyncio.to_thread(self._write, self._snapshot())
+
+    async def create(self) -> str:
+        job_id = str(uuid.uuid4())
+        async with self.lock:
+            self.jobs[job_id] = {
+                "status": "pending",
+                "video": None,
+                "error": None,
+                "created_at": time.time(),
+            }
+            await self._save()
+        return job_id
+
+    async def prune(self, max_age: float):
+        """Forget finished jobs older than max_age seconds."""
+        cutoff = time.time() - max_age
+        async with self.lock:
+            stale = [
+                job_id for job_id, job in self.jobs.items()
+                if job["status"] in ("complete", "error") and job.get("created_at", 0) < cutoff
+            ]
+            for job_id in stale:
+                del self.jobs[job_id]
+            if stale:
+                await self._save()
+
+    async def update(self, job_id: str, **fields):
+        async with self.lock:
+            self.jobs[job_id].update(fields)
+            await self._save()
+
+    def set_progress(self, job_id: str, progress: float):
+        # updated many times per encode, so only kept in memory
+        self.jobs[job_id]["progress"] = progress
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.jobs.get(job_id)
+
+
 registry = ModelRegistry()
 SAMPLES_DIR = Path("videos")
+SAMPLES_INDEX = SAMPLES_DIR / "videos.jsonl"
 OUTPUT_DIR = Path("outputs")
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
+# cap concurrent work so simultaneous requests queue up instead of
+# competing for the same cores
+ENCODE_SEM = asyncio.Semaphore(int(os.getenv("MAX_CONCURRENT_ENCODES", "2")))
+TTS_SEM = asyncio.Semaphore(int(os.getenv("MAX_CONCURRENT_TTS", "1")))
+
+# kept outside OUTPUT_DIR so the job table is never served by /outputs/
+STATE_DIR = Path("state")
+jobs = JobStore(STATE_DIR / "jobs.json")
+
+# rendered videos and subtitles older than this are deleted from OUTPUT_DIR
+OUTPUT_MAX_AGE = float(os.getenv("OUTPUT_MAX_AGE_HOURS", "24")) * 3600
+OUTPUT_GC_INTERVAL = 600
+# keep strong references so running jobs aren't garbage collected
+_job_tasks: set[asyncio.Task] = set()
+
+
+# parsed gallery, reloaded only when videos.jsonl changes on disk
+_videos_cache = {
+    "stamp": None,
+    "by_id": {},
+    # response models built once per reload, in gallery order
+    "samples": [],
+    # video id -> position in "samples"
+    "position": {},
+    # tag -> ids of videos carrying it
+    "tag_index": {},
+}
+
+
+def load_videos_cached() -> dict:
+    """Return the cached gallery, re-reading the index only if it changed.
+
+    A reload builds a fresh dict and swaps it in, so callers holding the
+    returned dict always see one consistent snapshot.
+    """
+    global _videos_cache
+    st = SAMPLES_INDEX.stat()
+    # appends can land within one mtime tick, so the size is part of the key
+    stamp = (st.st_mtime_ns, st.st_size)
+    cache = _videos_cache
+    if stamp != cache["stamp"]:
+        by_id = read_video_index(SAMPLES_INDEX)
+        tag_index: dict[str, set[str]] = defaultdict(set)
+        for v in by_id.values():
+            for tag in v["tags"]:
+                tag_index[tag].add(v["id"])
+
+        cache = {
+            "stamp": stamp,
+            "by_id": by_id,
+            "samples": [VideoSample(**v) for v in by_id.values()],
+            "position": {video_id: i for i, video_id in enumerate(by_id)},
+            "tag_index": dict(tag_index),
+        }
+        _videos_cache = cache
+    return cache
+
+
+def _delete_old_outputs(max_age: float):
+    now = time.time()
+    for p in OUTPUT_DIR.iterdir():
+        try:
+            if p.is_file() and now - p.stat().st_mtime > max_age:
+                p.unlink(missing_ok=True)
+        except OSError:
+            # the file vanished or became unreadable between listing and unlinking
+            continue
+
+
+async def gc_loop():
+    while True:
+        await asyncio.to_thread(_delete_old_outputs, OUTPUT_MAX_AGE)
+        await jobs.prune(OUTPUT_MAX_AGE)
+        await asyncio.sleep(OUTPUT_GC_INTERVAL)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -173,7 +359,13 @@ async def lifespan(app: FastAPI):
         "supertonic-66m",
         SupertonicModel("models/supertonic/onnx", str(OUTPUT_DIR))
     )
+    jobs.load()
+    # galleries created before videos.jsonl only have videos.json
+    if not SAMPLES_INDEX.exists() and (SAMPLES_DIR / "videos.json").exists():
+        seed_video_index(SAMPLES_INDEX, SAMPLES_DIR / "videos.json")
+    gc_task = asyncio.create_task(gc_loop())
     yield
+    gc_task.cancel()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -210,6 +402,30 @@ class GenerateRequest(BaseModel):
     video: VideoConfig
 
 
+class TTSModelInfo(BaseModel):
+    name: str
+    available_voices: list[str]
+    running: bool
+    voice_cloning: bool
+
+
+class TTSModelsResponse(BaseModel):
+    models: list[TTSModelInfo]
+
+
+class JobSubmitted(BaseModel):
+    job_id: str
+
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str
+    video: Optional[str] = None
+    error: Optional[str] = None
+    # fraction of the encode done, while running
+    progress: Optional[float] = None
+
+
 class VideoSample(BaseModel):
     id: str
     name: str
@@ -226,9 +442,11 @@ class VideoSamplesResponse(BaseModel):
     videos: list[VideoSample]
 
 
+# endpoints declare their response models so FastAPI serializes them
+# straight to JSON bytes with pydantic instead of the generic encoder
 @app.get("/tts/models/")
-def list_tts_models():
-    return {"models": registry.list_models()}
+def list_tts_models() -> TTSModelsResponse:
+    return TTSModelsResponse(models=registry.list_models())
 
 
 @app.get("/samples/videos")
@@ -236,20 +454,19 @@ def list_video_samples(
     page: int = 1,
     page_size: int = 10,
     tags: Optional[str] = None,
-):
-    samples_file = SAMPLES_DIR / "videos.json"
-    if not samples_file.exists():
+) -> VideoSamplesResponse:
+    if not SAMPLES_INDEX.exists():
         raise HTTPException(status_code=404, detail="Samples not found")
 
-    with open(samples_file, "r") as f:
-        all_videos = json.load(f)["videos"]
+    cache = load_videos_cached()
+    all_videos = cache["samples"]
 
     if tags:
+        # a video matches if it carries any of the requested tags
         tag_list = [t.strip() for t in tags.split(",")]
-        all_videos = [
-            v for v in all_videos
-            if any(tag in v["tags"] for tag in tag_list)
-        ]
+        ids = set().union(*(cache["tag_index"].get(tag, ()) for tag in tag_list))
+        positions = sorted(cache["position"][video_id] for video_id in ids)
+        all_videos = [all_videos[i] for i in positions]
 
     total_videos = len(all_videos)
     total_pages = (total_videos + page_size - 1) // page_size
@@ -263,22 +480,24 @@ def list_video_samples(
         page_size=page_size,
         total_videos=total_videos,
         total_pages=total_pages,
-        videos=[VideoSample(**v) for v in videos],
+        videos=videos,
     )
 
 
-@app.post("/generate/{model_name}")
-async def generate_video(model_name: str, request: GenerateRequest):
+def _resolve_generate_request(model_name: str, request: GenerateRequest) -> tuple[TTSModel, Path, dict]:
     try:
         model = registry.get(model_name)
     except ValueError:
         raise HTTPException(status_code=404, detail=f"Model {model_name} not found or not running")
 
-    samples_file = SAMPLES_DIR / "videos.json"
-    with open(samples_file, "r") as f:
-        all_videos = json.load(f)["videos"]
+    # checked up front so the stream endpoint rejects it before the 200 goes out
+    if request.tts.voice not in model.get_available_voices():
+        raise HTTPException(status_code=404, detail=f"Voice {request.tts.voice} not found")
+
+    if not SAMPLES_INDEX.exists():
+        raise HTTPException(status_code=404, detail="Samples not found")
 
-    video_data = next((v for v in all_videos if v["id"] == request.video.id), None)
+    video_data = load_videos_cached()["by_id"].get(request.video.id)
     if not video_data:
         raise HTTPException(status_code=404, detail=f"Video {request.video.id} not found")
 
@@ -286,7 +505,13 @@ async def generate_video(model_name: str, request: GenerateRequest):
     if not video_path.exists():
         raise HTTPException(status_code=404, detail=f"Sample file not found")
 
-    tts_result = model.generate(
+    return model, video_path, video_data
+
+
+async def _synthesize(model: TTSModel, request: GenerateRequest) -> TTSResult:
+    # callers hold TTS_SEM
+    return await asyncio.to_thread(
+        model.generate,
         text=request.tts.text,
         voice=request.tts.voice,
         speed=request.tts.speed,
@@ -294,32 +519,119 @@ async def generate_video(model_name: str, request: GenerateRequest):
         end_silence_duration=request.tts.end_silence_duration,
     )
 
+
+def _dub_options(video_data: dict, request: GenerateRequest) -> dict:
     subtitle_config = request.subtitle or SubtitleConfig()
     audio_config = request.audio or AudioConfig()
+    return {
+        "video_audio_volume": audio_config.background_audio_volume,
+        "font_size": subtitle_config.font_size,
+        "outline": subtitle_config.outline,
+        "shadow": subtitle_config.shadow,
+        "margin_v": subtitle_config.marginv,
+        "video_duration": video_data.get("duration_seconds"),
+        "video_has_audio": video_data.get("has_audio"),
+    }
 
-    output_path = OUTPUT_DIR / f"{uuid.uuid4()}.mp4"
-
-    dub_video(
-        video_path=str(video_path),
-        voice_path=tts_result.wav_path,
-        srt_path=tts_result.srt_path,
-        output_path=str(output_path),
-        video_audio_volume=audio_config.background_audio_volume,
-        font_size=subtitle_config.font_size,
-        outline=subtitle_config.outline,
-        shadow=subtitle_config.shadow,
-        margin_v=subtitle_config.marginv,
-    )
 
-    return {"video": f"/outputs/{output_path.name}"}
+@app.post("/generate/{model_name}", status_code=202)
+async def generate_video(model_name: str, request: GenerateRequest) -> JobSubmitted:
+    model, video_path, video_data = _resolve_generate_request(model_name, request)
+
+    job_id = await jobs.create()
+    task = asyncio.create_task(_run_job(job_id, model, video_path, video_data, request))
+    _job_tasks.add(task)
+    task.add_done_callback(_job_tasks.discard)
+
+    return JobSubmitted(job_id=job_id)
+
+
+async def _run_job(
+    job_id: str,
+    model: TTSModel,
+    video_path: Path,
+    video_data: dict,
+    request: GenerateRequest,
+):
+    try:
+        async with TTS_SEM:
+            await jobs.update(job_id, status="running")
+            tts_result = await _synthesize(model, request)
+
+        output_path = OUTPUT_DIR / f"{uuid.uuid4()}.mp4"
+
+        def on_progress(seconds: float):
+            if tts_result.duration > 0:
+                jobs.set_progress(job_id, min(seconds / tts_result.duration, 1.0))
+
+        async with ENCODE_SEM:
+            await dub_video(
+                video_path=str(video_path),
+                voice_path=None,
+                voice_pcm=tts_result.pcm,
+                voice_sr=tts_result.sample_rate,
+                srt_path=tts_result.srt_path,
+                output_path=str(output_path),
+                on_progress=on_progress,
+                **_dub_options(video_data, request),
+            )
+    except Exception as e:
+        await jobs.update(job_id, status="error", error=str(e))
+        return
+
+    await jobs.update(job_id, status="complete", video=f"/outputs/{output_path.name}")
+
+
+@app.post("/generate/stream/{model_name}")
+async def generate_video_stream(model_name: str, request: GenerateRequest):
+    model, video_path, video_data = _resolve_generate_request(model_name, request)
+    async with TTS_SEM:
+        tts_result = await _synthesize(model, request)
+
+    async def body():
+        async with ENCODE_SEM:
+            async for chunk in stream_dub_video(
+                video_path=str(video_path),
+                voice_path=None,
+                voice_pcm=tts_result.pcm,
+                voice_sr=tts_result.sample_rate,
+                srt_path=tts_result.srt_path,
+                **_dub_options(video_data, request),
+            ):
+                yield chunk
+
+    return StreamingResponse(body(), media_type="video/mp4")
+
+
+@app.get("/generate/status/{job_id}")
+def get_job_status(job_id: str) -> JobStatus:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return JobStatus(job_id=job_id, **job)
 
 
 @app.get("/outputs/{filename}")
 def get_output_file(filename: str):
     file_path = OUTPUT_DIR / filename
-    if not file_path.exists():
+    # only rendered videos are public; the subtitles live here too
+    if file_path.suffix != ".mp4":
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path)
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not stat.S_ISREG(st.st_mode):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # handing over the stat result saves Starlette a second stat before it
+    # streams the file (via sendfile where the server supports it)
+    return FileResponse(
+        str(file_path),
+        stat_result=st,
+        media_type="video/mp4",
+        headers={"Accept-Ranges": "bytes"},
+    )
 
 @app.get("/")
 async def serve_index():
@@ -1,4 +1,3 @@
-import json
 import os
 import time
 from contextlib import contextmanager
@@ -7,14 +6,15 @@ from unicodedata import normalize
 
 import numpy as np
 import onnxruntime as ort
+import orjson
 
 import re
 
 
 class UnicodeProcessor:
     def __init__(self, unicode_indexer_path: str):
-        with open(unicode_indexer_path, "r") as f:
-            self.indexer = json.load(f)
+        with open(unicode_indexer_path, "rb") as f:
+            self.indexer = orjson.loads(f.read())
 
     def _preprocess_text(self, text: str) -> str:
         # TODO: Need advanced normalizer for better performance
@@ -149,6 +149,8 @@ class TextToSpeech:
         vocoder_ort: ort.InferenceSession,
     ):
         self.cfgs = cfgs
+        # CUDA sessions keep the denoising loop on device via IOBinding
+        self.use_iobinding = "CUDAExecutionProvider" in vector_est_ort.get_providers()
         self.text_processor = text_processor
         self.dp_ort = dp_ort
         self.text_enc_ort = text_enc_ort
@@ -193,6 +195,12 @@ class TextToSpeech:
         )  # dur_onnx: [bsz]
         xt, latent_mask = self.sample_noisy_latent(dur_onnx)
         total_step_np = np.array([total_step] * bsz, dtype=np.float32)
+        if self.use_iobinding:
+            xt = self._denoise_on_device(
+                xt, text_emb_onnx, style, text_mask, latent_mask, total_step, total_step_np
+            )
+            wav, *_ = self.vocoder_ort.run(None, {"latent": xt})
+            return wav, dur_onnx
         for step in range(total_step):
             current_step = np.array([step] * bsz, dtype=np.float32)
             xt, *_ = self.vector_est_ort.run(
@@ -210,6 +218,40 @@ class TextToSpeech:
         wav, *_ = self.vocoder_ort.run(None, {"latent": xt})
         return wav, dur_onnx
 
+    def _denoise_on_device(
+        self,
+        xt: np.ndarray,
+        text_emb: np.ndarray,
+        style: Style,
+        text_mask: np.ndarray,
+        latent_mask: np.ndarray,
+        total_step: int,
+        total_step_np: np.ndarray,
+    ) -> np.ndarray:
+        """Run the vector estimator steps with inputs and the latent kept on the GPU."""
+        bsz = xt.shape[0]
+        binding = self.vector_est_ort.io_binding()
+        output_name = self.vector_est_ort.get_outputs()[0].name
+
+        # everything except the latent and the step counter is constant across steps
+        for name, value in (
+            ("text_emb", text_emb),
+            ("style_ttl", style.ttl),
+            ("text_mask", text_mask),
+            ("latent_mask", latent_mask),
+            ("total_step", total_step_np),
+        ):
+            binding.bind_ortvalue_input(name, ort.OrtValue.ortvalue_from_numpy(value, "cuda", 0))
+
+        xt_ort = ort.OrtValue.ortvalue_from_numpy(xt, "cuda", 0)
+        for step in range(total_step):
+            binding.bind_ortvalue_input("noisy_latent", xt_ort)
+            binding.bind_cpu_input("current_step", np.array([step] * bsz, dtype=np.float32))
+            binding.bind_output(output_name, "cuda", 0)
+            self.vector_est_ort.run_with_iobinding(binding)
+            xt_ort = binding.get_outputs()[0]
+        return xt_ort.numpy()
+
     # def __call__(
     #     self,
     #     text: str,
@@ -327,23 +369,32 @@ def get_latent_mask(
 
 
 def load_onnx(
-    onnx_path: str, opts: ort.SessionOptions, providers: list[str]
+    onnx_path: str, opts: ort.SessionOptions, providers: list
 ) -> ort.InferenceSession:
     return ort.InferenceSession(onnx_path, sess_options=opts, providers=providers)
 
 
+def onnx_model_path(onnx_dir: str, name: str, use_int8: bool = False) -> str:
+    """Path to a model graph, preferring the int8 copy from download_models.py if asked."""
+    if use_int8:
+        int8_path = os.path.join(onnx_dir, f"{name}_int8.onnx")
+        if os.path.exists(int8_path):
+            return int8_path
+    return os.path.join(onnx_dir, f"{name}.onnx")
+
+
 def load_onnx_all(
-    onnx_dir: str, opts: ort.SessionOptions, providers: list[str]
+    onnx_dir: str, opts: ort.SessionOptions, providers: list, use_int8: bool = False
 ) -> tuple[
     ort.InferenceSession,
     ort.InferenceSession,
     ort.InferenceSession,
     ort.InferenceSession,
 ]:
-    dp_onnx_path = os.path.join(onnx_dir, "duration_predictor.onnx")
-    text_enc_onnx_path = os.path.join(onnx_dir, "text_encoder.onnx")
-    vector_est_onnx_path = os.path.join(onnx_dir, "vector_estimator.onnx")
-    vocoder_onnx_path = os.path.join(onnx_dir, "vocoder.onnx")
+    dp_onnx_path = onnx_model_path(onnx_dir, "duration_predictor", use_int8)
+    text_enc_onnx_path = onnx_model_path(onnx_dir, "text_encoder", use_int8)
+    vector_est_onnx_path = onnx_model_path(onnx_dir, "vector_estimator", use_int8)
+    vocoder_onnx_path = onnx_model_path(onnx_dir, "vocoder", use_int8)
 
     dp_ort = load_onnx(dp_onnx_path, opts, providers)
     text_enc_ort = load_onnx(text_enc_onnx_path, opts, providers)
@@ -354,8 +405,8 @@ def load_onnx_all(
 
 def load_cfgs(onnx_dir: str) -> dict:
     cfg_path = os.path.join(onnx_dir, "tts.json")
-    with open(cfg_path, "r") as f:
-        cfgs = json.load(f)
+    with open(cfg_path, "rb") as f:
+        cfgs = orjson.loads(f.read())
     return cfgs
 
 
@@ -365,16 +416,49 @@ def load_text_processor(onnx_dir: str) -> UnicodeProcessor:
     return text_processor
 
 
-def load_text_to_speech(onnx_dir: str, use_gpu: bool = False) -> TextToSpeech:
+# ordered by preference
+GPU_PROVIDERS = [
+    "CUDAExecutionProvider",
+    "CoreMLExecutionProvider",
+    "DmlExecutionProvider",
+]
+
+
+def get_gpu_provider(candidates: Optional[list[str]] = None) -> Optional[str]:
+    """Return the first of candidates (default GPU_PROVIDERS) this onnxruntime build offers."""
+    available = ort.get_available_providers()
+    return next((p for p in candidates or GPU_PROVIDERS if p in available), None)
+
+
+def load_text_to_speech(
+    onnx_dir: str,
+    use_gpu: bool = False,
+    use_int8: bool = False,
+    gpu_providers: Optional[list[str]] = None,
+) -> TextToSpeech:
     opts = ort.SessionOptions()
-    if use_gpu:
-        raise NotImplementedError("GPU mode is not fully tested")
+    gpu_provider = get_gpu_provider(gpu_providers) if use_gpu else None
+    if use_gpu and gpu_provider is None:
+        print("No GPU execution provider available, falling back to CPU")
+    if gpu_provider == "CUDAExecutionProvider":
+        providers = [
+            ("CUDAExecutionProvider", {"cudnn_conv_algo_search": "HEURISTIC"}),
+            "CPUExecutionProvider",
+        ]
+        print("Using CUDA for inference")
+    elif gpu_provider is not None:
+        providers = [gpu_provider, "CPUExecutionProvider"]
+        print(f"Using {gpu_provider} for inference")
     else:
         providers = ["CPUExecutionProvider"]
         print("Using CPU for inference")
+    # int8 weights only pay off on CPU; GPU providers keep the fp32 graphs
+    use_int8 = use_int8 and gpu_provider is None
+    if use_int8:
+        print("Using int8 models where available")
     cfgs = load_cfgs(onnx_dir)
     dp_ort, text_enc_ort, vector_est_ort, vocoder_ort = load_onnx_all(
-        onnx_dir, opts, providers
+        onnx_dir, opts, providers, use_int8
     )
     text_processor = load_text_processor(onnx_dir)
     return TextToSpeech(
@@ -386,8 +470,8 @@ def load_voice_style(voice_style_paths: list[str], verbose: bool = False) -> Sty
     bsz = len(voice_style_paths)
 
     # Read first file to get dimensions
-    with open(voice_style_paths[0], "r") as f:
-        first_style = json.load(f)
+    with open(voice_style_paths[0], "rb") as f:
+        first_style = orjson.loads(f.read())
     ttl_dims = first_style["style_ttl"]["dims"]
     dp_dims = first_style["style_dp"]["dims"]
 
@@ -397,8 +481,8 @@ def load_voice_style(voice_style_paths: list[str], verbose: bool = False) -> Sty
 
     # Fill in the data
     for i, voice_style_path in enumerate(voice_style_paths):
-        with open(voice_style_path, "r") as f:
-            voice_style = json.load(f)
+        with open(voice_style_path, "rb") as f:
+            voice_style = orjson.loads(f.read())
 
         ttl_data = np.array(
             voice_style["style_ttl"]["data"], dtype=np.float32
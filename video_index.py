@@ -0,0 +1,56 @@
+from pathlib import Path
+
+import orjson
+
+
+def read_video_index(path: Path) -> dict[str, dict]:
+    """Replay the append-only gallery log into {id: entry}, in insertion order.
+
+    Each line is a video entry, or a tombstone {"id": ..., "deleted": true}
+    that removes an earlier entry with the same id.
+    """
+    index: dict[str, dict] = {}
+    with open(path, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                # a partially written last line from an interrupted add
+                continue
+            if record.get("deleted"):
+                index.pop(record["id"], None)
+            else:
+                index[record["id"]] = record
+    return index
+
+
+def seed_video_index(index_path: Path, legacy_json_path: Path):
+    """Create the log from a videos.json gallery that predates videos.jsonl."""
+    videos = []
+    if legacy_json_path.exists() and legacy_json_path.stat().st_size > 0:
+        try:
+            videos = orjson.loads(legacy_json_path.read_bytes()).get("videos", [])
+        except orjson.JSONDecodeError:
+            pass
+
+    index_path.touch()
+    append_video_records(index_path, videos)
+
+
+def append_video_records(path: Path, records: list[dict]):
+    """Append entries or tombstones to the gallery log without rewriting it."""
+    # start on a fresh line if an earlier write was cut off mid-record
+    needs_newline = False
+    if path.exists() and path.stat().st_size > 0:
+        with open(path, "rb") as f:
+            f.seek(-1, 2)
+            needs_newline = f.read(1) != b"\n"
+
+    with open(path, "ab") as f:
+        if needs_newline:
+            f.write(b"\n")
+        for record in records:
+            f.write(orjson.dumps(record) + b"\n")